@@ -16,9 +16,31 @@ PROJECT_DIR = Path(__file__).resolve().parent
 # 市场范围：可选 "SH"(沪), "SZ"(深), "BJ"(北交所)
 MARKETS = ["SH", "SZ"]
 
-# 行业：默认筛制造业（cninfo 行业门类=制造业 或 行业编码以 C 开头）
+# 行业：--slow 逐只判定时用（cninfo 行业门类=制造业 或 行业编码以 C 开头）
 INDUSTRY_GATE = "制造业"
 
+# Step1 默认用申万行业分类批量判定：以下申万一级行业代码（前 2 位）视为制造业
+# 注意覆盖缺口：通信(73)的通信设备、计算机(71)的计算机硬件、农林牧渔(11)的饲料、
+# 石油石化(75)的炼化在证监会口径属于制造业，但所在一级行业整体不算，这里不会选中；
+# 需要证监会严格口径请用 python step1_industry.py --slow
+SW_MANUFACTURING_L1 = [
+    "22",  # 基础化工
+    "23",  # 钢铁
+    "24",  # 有色金属
+    "27",  # 电子
+    "28",  # 汽车
+    "33",  # 家用电器
+    "34",  # 食品饮料
+    "35",  # 纺织服饰
+    "36",  # 轻工制造
+    "37",  # 医药生物
+    "61",  # 建筑材料
+    "63",  # 电力设备
+    "64",  # 机械设备
+    "65",  # 国防军工
+    "77",  # 美容护理
+]
+
 # 年报会计年度范围（企业年报属于“上一会计年度”）
 START_YEAR = 2014
 END_YEAR = 2024
@@ -37,6 +59,12 @@ OUTPUT_DIR = PROJECT_DIR / "output"
 # - 你也可以改成 Path(r"D:\cninfo_pdfs") 把 PDF 放到其他盘
 #PDF_DIR_OVERRIDE = Path(r"G:\pdf1")
 PDF_DIR_OVERRIDE = None
+
+# Step4 文本缓存（每份年报去空白后的全文，zstd 压缩；全量可达数 GB）：
+# - TEXT_CACHE_ENABLED = False 关闭缓存（每次都重新解析 PDF）
+# - TEXT_CACHE_DIR_OVERRIDE = None 表示用 OUTPUT_DIR/text_cache，也可改成 Path(r"D:\cninfo_text_cache")
+TEXT_CACHE_ENABLED = True
+TEXT_CACHE_DIR_OVERRIDE = None
 # =========================
 # 网络/性能参数（你偶尔改）
 # =========================
@@ -44,12 +72,18 @@ USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTM
 REFERER = "https://www.cninfo.com.cn/"
 
 SLEEP_BETWEEN_REQUESTS = 0.25
+RATE_LIMIT_PER_SEC = 4.0       # 多线程拉清单时，所有线程合计每秒请求数上限
+RATE_LIMIT_BURST = 4           # 允许的瞬时突发请求数
+DOWNLOAD_RATE_PER_SEC = 8.0    # PDF 下载：所有线程合计每秒请求数上限
 REQUEST_TIMEOUT = (10, 60)     # (连接超时, 读取超时)
+PROBE_TIMEOUT = (10, 15)       # 下载前 Range 探测（只取 4 字节）的超时
 MAX_RETRY = 4
 
+MANIFEST_WORKERS = 8           # 年报清单拉取并发（受 RATE_LIMIT_PER_SEC 总量限制）
 DOWNLOAD_WORKERS = 8           # 下载并发（过大可能触发风控/限流）
-EXTRACT_WORKERS = 16           # 抽取+词频并发（CPU/IO混合，Windows建议 8~12）
+EXTRACT_WORKERS = 16           # 抽取+词频进程数（CPU 密集，建议不超过 CPU 核数）
 TEXT_MIN_LEN = 500             # 抽取到的文本去空白后长度 < 该值，则认为可能是扫描版（不做 OCR 的情况下计 0）
+SCAN_PAGE_MIN_LEN = 50         # 抽样首/中/尾页平均每页字数 < 该值，直接判为扫描版，跳过全量抽取
 
 # 标题过滤（可按需调整）
 TITLE_EXCLUDE_PATTERNS = ["摘要", "英文", "取消", "更正说明"]
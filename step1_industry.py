@@ -2,8 +2,15 @@
 """
 Step 1: 行业筛选 -> output/manufacturing_stocks.csv
 
-用 cninfo 行业变更接口判定“制造业”：
-- 行业门类 == "制造业" 或 行业编码以 "C" 开头
+默认：一次拉取全市场申万行业分类（ak.stock_industry_clf_hist_sw），
+取每只股票最新归属，申万一级属于 config.SW_MANUFACTURING_L1 的视为制造业，
+再与 A 股代码表求交（代码表 + 行业分类共 2 次网络请求）。
+申万口径与证监会“制造业”门类不完全一致：按申万一级整体划分，会漏掉分散在
+非制造类一级行业里的证监会 C 门类公司，主要是
+  通信(73) 中的通信设备、计算机(71) 中的计算机硬件、
+  农林牧渔(11) 中的饲料、石油石化(75) 中的炼化；
+反过来也可能混入少量非 C 门类公司。需要严格口径时用 --slow：
+逐只调用 cninfo 行业变更接口，行业门类 == "制造业" 或 行业编码以 "C" 开头。
 
 运行：
   python step1_industry.py
@@ -11,6 +18,8 @@ Step 1: 行业筛选 -> output/manufacturing_stocks.csv
   python step1_industry.py --rebuild
 测试只跑前 200 家：
   python step1_industry.py --limit 200
+严格按证监会口径逐只查询（很慢，约 5000 次请求）：
+  python step1_industry.py --slow
 """
 
 from __future__ import annotations
@@ -28,17 +37,19 @@ import akshare as ak
 import config
 
 
-def markets_filter(code: str) -> bool:
-    code = str(code)
+def market_prefixes() -> set[str]:
+    """
+    config.MARKETS -> 代码首位集合
+    """
     want = set(config.MARKETS)
-    ok = False
-    if "SH" in want and code.startswith("6"):
-        ok = True
-    if "SZ" in want and (code.startswith("0") or code.startswith("3")):
-        ok = True
-    if "BJ" in want and code.startswith("8"):
-        ok = True
-    return ok
+    prefixes: set[str] = set()
+    if "SH" in want:
+        prefixes |= {"6"}
+    if "SZ" in want:
+        prefixes |= {"0", "3"}
+    if "BJ" in want:
+        prefixes |= {"8"}
+    return prefixes
 
 
 def is_manufacturing(code: str) -> bool:
@@ -71,10 +82,35 @@ def is_manufacturing(code: str) -> bool:
         return False
 
 
+def fetch_manufacturing_universe() -> set[str]:
+    """
+    一次拉取全市场申万行业分类历史（每行 = 某只股票某次行业归属），
+    取每只股票最新一条，申万一级属于 config.SW_MANUFACTURING_L1 的视为制造业。
+    返回制造业股票代码集合
+    """
+    df = ak.stock_industry_clf_hist_sw()  # 列：symbol, start_date, industry_code, update_time
+    if df is None or df.empty:
+        raise RuntimeError("申万行业分类接口返回为空，可改用 --slow 逐只查询")
+
+    df = df[["symbol", "start_date", "industry_code"]].copy()
+    df["symbol"] = df["symbol"].astype(str).str.strip().str.zfill(6)
+    df["start_date"] = pd.to_datetime(df["start_date"], errors="coerce")
+    latest = df.sort_values("start_date").drop_duplicates("symbol", keep="last")
+
+    # 申万行业代码 6 位，前 2 位为一级行业
+    l1 = latest["industry_code"].astype(str).str.strip().str.zfill(6).str[:2]
+    codes = set(latest.loc[l1.isin(config.SW_MANUFACTURING_L1), "symbol"])
+    if not codes:
+        # 多半是 industry_code 格式变了；不要把空结果写进缓存文件
+        raise RuntimeError("申万行业分类中没有匹配 SW_MANUFACTURING_L1 的股票（industry_code 格式可能已变），可改用 --slow 逐只查询")
+    return codes
+
+
 def main(argv: Optional[list[str]] = None) -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--rebuild", action="store_true", help="忽略缓存，强制重建")
     parser.add_argument("--limit", type=int, default=None, help="只处理前 N 家（调试用）")
+    parser.add_argument("--slow", action="store_true", help="逐只调用行业变更接口（批量接口不可用时的兜底）")
     args = parser.parse_args(argv)
 
     out_dir = config.OUTPUT_DIR
@@ -94,20 +130,23 @@ def main(argv: Optional[list[str]] = None) -> int:
     df = df[["code", "name"]].copy()
     df["code"] = df["code"].astype(str)
 
-    df = df[df["code"].apply(markets_filter)].reset_index(drop=True)
+    mask = df["code"].str[0].isin(market_prefixes())
+    df = df.loc[mask].reset_index(drop=True)
 
     if args.limit:
         df = df.head(args.limit)
 
-    rows = []
-    for _, r in tqdm(df.iterrows(), total=len(df), desc="Step1 行业筛选(制造业)"):
-        code = str(r["code"])
-        name = str(r["name"])
-        if is_manufacturing(code):
-            rows.append({"code": code, "name": name})
-        time.sleep(config.SLEEP_BETWEEN_REQUESTS)
-
-    out_df = pd.DataFrame(rows).sort_values(["code"])
+    if args.slow:
+        keep = []
+        for code in tqdm(df["code"], total=len(df), desc="Step1 行业筛选(制造业, 逐只)"):
+            keep.append(is_manufacturing(code))
+            time.sleep(config.SLEEP_BETWEEN_REQUESTS)
+        out_df = df[keep]
+    else:
+        mfg_codes = fetch_manufacturing_universe()
+        out_df = df[df["code"].isin(mfg_codes)]
+
+    out_df = out_df.sort_values(["code"])
     out_df.to_csv(out_path, index=False, encoding="utf-8-sig")
     print(f"[Step1] 完成：{out_path}，共 {len(out_df)} 家")
     return 0
@@ -9,13 +9,15 @@ Step 2: 年报公告清单 -> output/report_manifest.csv
   python step2_manifest.py --rebuild
 调试只跑前 50 家：
   python step2_manifest.py --limit 50
+改并发：
+  python step2_manifest.py --workers 12
 """
 
 from __future__ import annotations
 
 import argparse
+import concurrent.futures as cf
 import re
-import time
 from pathlib import Path
 from typing import Optional
 from urllib.parse import urlparse, parse_qs
@@ -26,9 +28,11 @@ from tqdm import tqdm
 import akshare as ak
 
 import config
+from ratelimit import TokenBucket
 
 
 YEAR_PAT = re.compile(r"(\d{4})年?年度报告")
+EXCL_RE = re.compile("|".join(map(re.escape, config.TITLE_EXCLUDE_PATTERNS))) if config.TITLE_EXCLUDE_PATTERNS else None
 
 
 def normalize_date_str(s: str) -> Optional[str]:
@@ -65,22 +69,94 @@ def disclosure_start_end() -> tuple[str, str]:
     return start, end
 
 
-def parse_report_year(title: str) -> Optional[int]:
-    m = YEAR_PAT.search(title or "")
-    if not m:
-        return None
-    return int(m.group(1))
+def fetch_company_reports(code: str, name: str, start_date: str, end_date: str, bucket: TokenBucket) -> list[dict]:
+    """
+    拉取单个公司的年报清单（单公司失败不影响全局）
+    """
+    rows = []
+    try:
+        bucket.acquire()
+        df = ak.stock_zh_a_disclosure_report_cninfo(
+            symbol=code,
+            market="沪深京",
+            category="年报",
+            start_date=start_date,
+            end_date=end_date,
+        )
+        if df is None or df.empty:
+            return rows
+
+        # 统一列名
+        rename_map = {}
+        for c in df.columns:
+            if c in ["代码", "证券代码"]:
+                rename_map[c] = "code"
+            elif c in ["简称", "证券简称"]:
+                rename_map[c] = "name"
+            elif c in ["公告标题", "标题"]:
+                rename_map[c] = "title"
+            elif c in ["公告时间", "时间", "公告日期", "日期"]:
+                rename_map[c] = "ann_date"
+            elif c in ["公告链接", "链接", "公告URL", "公告url", "url", "URL"]:
+                rename_map[c] = "detail_url"
+        df = df.rename(columns=rename_map)
+
+        # 年份解析 + 标题过滤
+        df["title"] = df["title"].fillna("").astype(str)
+        year_s = df["title"].str.extract(YEAR_PAT.pattern, expand=False)
+        df["report_year"] = pd.to_numeric(year_s, errors="coerce").astype("Int64")
+        mask = df["report_year"].between(config.START_YEAR, config.END_YEAR, inclusive="both").fillna(False)
+        if EXCL_RE is not None:
+            mask &= ~df["title"].str.contains(EXCL_RE, na=False)
+        df = df.loc[mask].copy()
+
+        # 取同公司同年度最新一条
+        df["ann_date"] = pd.to_datetime(df["ann_date"], errors="coerce")
+        ann_key = df["ann_date"].fillna(pd.Timestamp.min)  # 日期缺失的仅在同组无其他记录时入选
+        idx = ann_key.groupby([df["code"], df["report_year"]], sort=False).idxmax()
+        df = df.loc[idx]
+
+        n = len(df)
+        titles = df["title"].astype(str).str.strip().to_numpy()
+        dates = df["ann_date"].dt.strftime("%Y-%m-%d").fillna("").to_numpy()
+        years = df["report_year"].astype(int).to_numpy()
+        if "detail_url" in df.columns:
+            urls = df["detail_url"].astype(str).str.strip().to_numpy()
+        else:
+            urls = [""] * n
+
+        for i in range(n):
+            ann_date = dates[i]
+            detail_url = urls[i]
+
+            pdf_url = ""
+            try:
+                if detail_url:
+                    pdf_url = pdf_url_from_detail_url(detail_url, ann_date_fallback=ann_date)
+            except Exception:
+                pdf_url = ""
+
+            rows.append({
+                "code": code,
+                "name": name,
+                "report_year": int(years[i]),
+                "ann_date": ann_date,
+                "title": titles[i],
+                "detail_url": detail_url,
+                "pdf_url": pdf_url,
+            })
 
+    except Exception as e:
+        print(f"[Step2] 失败 {code}：{e}")
 
-def title_excluded(title: str) -> bool:
-    t = str(title or "")
-    return any(pat in t for pat in config.TITLE_EXCLUDE_PATTERNS)
+    return rows
 
 
 def main(argv: Optional[list[str]] = None) -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--rebuild", action="store_true", help="忽略缓存，强制重建")
     parser.add_argument("--limit", type=int, default=None, help="只处理前 N 家（调试用）")
+    parser.add_argument("--workers", type=int, default=config.MANIFEST_WORKERS, help="清单拉取并发数")
     args = parser.parse_args(argv)
 
     out_dir = config.OUTPUT_DIR
@@ -96,81 +172,22 @@ def main(argv: Optional[list[str]] = None) -> int:
         raise FileNotFoundError(f"缺少 {manu_path}，请先运行 step1_industry.py")
 
     manu_df = pd.read_csv(manu_path, dtype={"code": str}, keep_default_na=False)
+    if "name" not in manu_df.columns:
+        manu_df["name"] = ""
     if args.limit:
         manu_df = manu_df.head(args.limit)
 
     start_date, end_date = disclosure_start_end()
+    bucket = TokenBucket(config.RATE_LIMIT_PER_SEC, config.RATE_LIMIT_BURST)
     all_rows = []
 
-    for _, r in tqdm(manu_df.iterrows(), total=len(manu_df), desc="Step2 拉取年报清单"):
-        code = str(r["code"])
-        name = str(r.get("name", ""))
-
-        try:
-            df = ak.stock_zh_a_disclosure_report_cninfo(
-                symbol=code,
-                market="沪深京",
-                category="年报",
-                start_date=start_date,
-                end_date=end_date,
-            )
-            if df is None or df.empty:
-                time.sleep(config.SLEEP_BETWEEN_REQUESTS)
-                continue
-
-            # 统一列名
-            rename_map = {}
-            for c in df.columns:
-                if c in ["代码", "证券代码"]:
-                    rename_map[c] = "code"
-                elif c in ["简称", "证券简称"]:
-                    rename_map[c] = "name"
-                elif c in ["公告标题", "标题"]:
-                    rename_map[c] = "title"
-                elif c in ["公告时间", "时间", "公告日期", "日期"]:
-                    rename_map[c] = "ann_date"
-                elif c in ["公告链接", "链接", "公告URL", "公告url", "url", "URL"]:
-                    rename_map[c] = "detail_url"
-            df = df.rename(columns=rename_map)
-
-            # 年份解析 + 过滤
-            df["report_year"] = df["title"].apply(parse_report_year)
-            df = df[df["report_year"].between(config.START_YEAR, config.END_YEAR, inclusive="both")]
-
-            # 标题过滤
-            df = df[~df["title"].apply(title_excluded)]
-
-            # 取同公司同年度最新一条
-            df["ann_date"] = pd.to_datetime(df["ann_date"], errors="coerce")
-            df = df.sort_values("ann_date").groupby(["code", "report_year"], as_index=False).tail(1)
-
-            for _, rr in df.iterrows():
-                ann_date = str(rr["ann_date"].date()) if pd.notna(rr["ann_date"]) else ""
-                detail_url = str(rr.get("detail_url", "")).strip()
-                title = str(rr.get("title", "")).strip()
-
-                pdf_url = ""
-                try:
-                    if detail_url:
-                        pdf_url = pdf_url_from_detail_url(detail_url, ann_date_fallback=ann_date)
-                except Exception:
-                    pdf_url = ""
-
-                all_rows.append({
-                    "code": code,
-                    "name": name,
-                    "report_year": int(rr["report_year"]),
-                    "ann_date": ann_date,
-                    "title": title,
-                    "detail_url": detail_url,
-                    "pdf_url": pdf_url,
-                })
-
-        except Exception as e:
-            # 单公司失败不影响全局
-            print(f"[Step2] 失败 {code}：{e}")
-
-        time.sleep(config.SLEEP_BETWEEN_REQUESTS)
+    with cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
+        futures = [
+            ex.submit(fetch_company_reports, str(r.code), str(r.name), start_date, end_date, bucket)
+            for r in manu_df[["code", "name"]].itertuples(index=False)
+        ]
+        for fut in tqdm(cf.as_completed(futures), total=len(futures), desc="Step2 拉取年报清单"):
+            all_rows.extend(fut.result())
 
     out_df = pd.DataFrame(all_rows).sort_values(["code", "report_year"])
     out_df.to_csv(out_path, index=False, encoding="utf-8-sig")
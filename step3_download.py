@@ -6,15 +6,18 @@ Step 3: 下载 PDF -> output/pdf/
   - output/pdf_download_failed.csv
 
 改进点（用于修复你这种“浏览器能下、Python 下不动”的 case）：
-- 同时尝试：https/http × .PDF/.pdf 四种组合
+- 同时尝试：https/http × .PDF/.pdf 四种组合（先用 Range 只取前 4 字节探测，命中 %PDF 再完整下载）
 - failed.csv 记录 status_code + last_url，便于定位真实原因
 - 403/429/5xx 更长退避，降低撞风控概率
+- 所有线程共享一个令牌桶限速（DOWNLOAD_RATE_PER_SEC），不再每条任务固定 sleep
 """
 
 from __future__ import annotations
 
 import argparse
 import concurrent.futures as cf
+import functools
+import os
 import random
 import time
 from dataclasses import dataclass
@@ -24,10 +27,12 @@ from urllib.parse import urlparse, parse_qs
 
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, RetryError
 from tqdm import tqdm
 
 import config
+from ratelimit import TokenBucket
 
 
 def get_pdf_dir() -> Path:
@@ -68,17 +73,42 @@ def pdf_url_from_detail_url(detail_url: str, ann_date_fallback: str = "") -> Opt
     return f"https://static.cninfo.com.cn/finalpage/{date}/{ann_id}.PDF"
 
 
-def is_pdf_file(path: Path) -> bool:
+@functools.lru_cache(maxsize=None)
+def _pdf_ok(path_str: str, size: int, mtime_ns: int) -> bool:
+    # (size, mtime) 作为缓存键的一部分：文件被重新下载后自动失效
+    if size < 1024:
+        return False
     try:
-        if not path.exists() or path.stat().st_size < 1024:
-            return False
-        with open(path, "rb") as f:
+        with open(path_str, "rb") as f:
             head = f.read(4)
         return head == b"%PDF"
     except Exception:
         return False
 
 
+def is_pdf_file(path: Path) -> bool:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return False
+    return _pdf_ok(str(path), st.st_size, st.st_mtime_ns)
+
+
+def scan_pdf_dir(pdf_dir: Path) -> dict[str, int]:
+    """
+    一次 scandir 扫描 PDF 目录，返回 {文件名: 大小}（只含有效 PDF）
+    """
+    good: dict[str, int] = {}
+    with os.scandir(pdf_dir) as it:
+        for e in it:
+            if not e.is_file():
+                continue
+            st = e.stat()
+            if _pdf_ok(e.path, st.st_size, st.st_mtime_ns):
+                good[e.name] = st.st_size
+    return good
+
+
 def candidate_urls(base_url: str) -> list[str]:
     """
     生成候选 URL：
@@ -126,6 +156,17 @@ def candidate_urls(base_url: str) -> list[str]:
     return sorted(urls, key=key)
 
 
+def make_session(workers: int) -> requests.Session:
+    """
+    所有下载线程共享一个 Session：连接池复用 TCP/TLS 连接（重试交给 tenacity）
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers * 2, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 def unwrap_exc(e: Exception) -> Exception:
     if isinstance(e, RetryError) and e.last_attempt:
         ex = e.last_attempt.exception()
@@ -133,21 +174,64 @@ def unwrap_exc(e: Exception) -> Exception:
     return e
 
 
+BASE_HEADERS = {
+    "User-Agent": config.USER_AGENT,
+    "Referer": config.REFERER,
+    "Accept": "application/pdf,application/octet-stream,*/*",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+    "Connection": "keep-alive",
+}
+
+
+@retry(
+    retry=retry_if_exception_type((requests.RequestException,)),
+    stop=stop_after_attempt(config.MAX_RETRY),
+    wait=wait_exponential(multiplier=1, min=1, max=30),
+)
+def _probe_once(url: str, session: requests.Session, limiter: TokenBucket) -> tuple[int, bytes]:
+    limiter.acquire()  # 每次尝试（含 tenacity 重试）都要拿令牌
+    headers = {**BASE_HEADERS, "Range": "bytes=0-3"}
+    with session.get(url, headers=headers, stream=True, timeout=config.PROBE_TIMEOUT, allow_redirects=True) as r:
+        status = r.status_code
+        if status in (403, 429) or (500 <= status <= 599):
+            r.raise_for_status()
+        if status not in (200, 206):
+            return status, b""
+        # 服务器忽略 Range 时会回 200 + 全文，这里只读前 4 字节就关闭连接
+        return status, r.raw.read(4, decode_content=True)
+
+
+RANGE_UNSUPPORTED = (405, 416)
+
+
+def probe(url: str, session: requests.Session, limiter: TokenBucket) -> tuple[bool, str]:
+    """
+    只取前 4 字节判断该候选 URL 是否真的是 PDF，返回 (是否命中, status_code)
+    """
+    try:
+        status, head = _probe_once(url, session, limiter)
+    except Exception as e:
+        ee = unwrap_exc(e)
+        if isinstance(ee, requests.HTTPError) and getattr(ee, "response", None) is not None:
+            return False, str(ee.response.status_code)
+        return False, ""
+    if status in RANGE_UNSUPPORTED:
+        # 不支持 Range 的服务器：探测不出结论，交给完整 GET（它自己会校验 %PDF）
+        return True, str(status)
+    if status in (200, 206):
+        # 状态正常但内容不是 PDF（多为 HTML 页面）：不记 status_code，与完整下载时的 magic 不匹配一致
+        return head == b"%PDF", ""
+    return False, str(status)
+
+
 @retry(
     retry=retry_if_exception_type((requests.RequestException,)),
     stop=stop_after_attempt(config.MAX_RETRY),
     wait=wait_exponential(multiplier=1, min=1, max=30),  # 退避加长
 )
-def _download_once(url: str, out_path: Path, session: requests.Session) -> tuple[int, int, str]:
-    headers = {
-        "User-Agent": config.USER_AGENT,
-        "Referer": config.REFERER,
-        "Accept": "application/pdf,application/octet-stream,*/*",
-        "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
-        "Connection": "keep-alive",
-    }
-
-    with session.get(url, headers=headers, stream=True, timeout=config.REQUEST_TIMEOUT, allow_redirects=True) as r:
+def _download_once(url: str, out_path: Path, session: requests.Session, limiter: TokenBucket) -> tuple[int, int, str]:
+    limiter.acquire()  # 每次尝试（含 tenacity 重试）都要拿令牌
+    with session.get(url, headers=BASE_HEADERS, stream=True, timeout=config.REQUEST_TIMEOUT, allow_redirects=True) as r:
         status = r.status_code
         ctype = r.headers.get("Content-Type", "") or ""
 
@@ -195,7 +279,7 @@ class DownloadResult:
     error_message: str
 
 
-def download_one(row: dict, pdf_dir: Path) -> DownloadResult:
+def download_one(row: dict, pdf_dir: Path, session: requests.Session, limiter: TokenBucket) -> DownloadResult:
     code = str(row.get("code", "")).strip()
     name = str(row.get("name", "")).strip()
     year = int(row.get("report_year", 0))
@@ -217,38 +301,37 @@ def download_one(row: dict, pdf_dir: Path) -> DownloadResult:
         return DownloadResult(code, name, year, ann_date, title, detail_url, base_pdf_url, str(pdf_path),
                               False, "", "", 0, "MissingPDFURL", "无法生成 pdf_url")
 
-    session = requests.Session()
-
-    # 对“失败重试”建议降低节奏：每条任务随机睡一点点
-    time.sleep(config.SLEEP_BETWEEN_REQUESTS + random.random() * 0.2)
-
     last_status = ""
     last_url = ""
 
     for u in candidate_urls(base_pdf_url):
-        try:
-            status, size, ctype = _download_once(u, pdf_path, session)
-
-            if not is_pdf_file(pdf_path):
-                try:
-                    pdf_path.unlink(missing_ok=True)
-                except Exception:
-                    pass
-                raise RuntimeError(f"下载内容不是 PDF（Content-Type={ctype}）")
-
-            return DownloadResult(code, name, year, ann_date, title, detail_url, u, str(pdf_path),
-                                  True, str(status), u, size, "", "")
-
-        except Exception as e:
-            ee = unwrap_exc(e)
-            last_url = u
-            if isinstance(ee, requests.HTTPError) and getattr(ee, "response", None) is not None:
-                last_status = str(ee.response.status_code)
-            else:
-                last_status = ""
-            # 403/429 再额外等一下（很关键）
-            if last_status in ("403", "429"):
-                time.sleep(10 + random.random() * 10)
+        last_url = u
+        ok, last_status = probe(u, session, limiter)
+
+        if ok:
+            try:
+                status, size, ctype = _download_once(u, pdf_path, session, limiter)
+
+                if not is_pdf_file(pdf_path):
+                    try:
+                        pdf_path.unlink(missing_ok=True)
+                    except Exception:
+                        pass
+                    raise RuntimeError(f"下载内容不是 PDF（Content-Type={ctype}）")
+
+                return DownloadResult(code, name, year, ann_date, title, detail_url, u, str(pdf_path),
+                                      True, str(status), u, size, "", "")
+
+            except Exception as e:
+                ee = unwrap_exc(e)
+                if isinstance(ee, requests.HTTPError) and getattr(ee, "response", None) is not None:
+                    last_status = str(ee.response.status_code)
+                else:
+                    last_status = ""
+
+        # 403/429 再额外等一下（很关键）
+        if last_status in ("403", "429"):
+            time.sleep(10 + random.random() * 10)
 
     # 全部尝试失败
     try:
@@ -262,37 +345,30 @@ def download_one(row: dict, pdf_dir: Path) -> DownloadResult:
 
 
 def build_success_failed(manifest_df: pd.DataFrame, pdf_dir: Path, error_map: dict[tuple[str, int], DownloadResult]):
-    rows_ok = []
-    rows_bad = []
+    df = pd.DataFrame({"code": manifest_df["code"].astype(str).str.strip(),
+                       "report_year": manifest_df["report_year"].astype(int)})
+    for c in ["name", "ann_date", "title", "detail_url", "pdf_url"]:
+        df[c] = manifest_df[c].astype(str).str.strip() if c in manifest_df.columns else ""
+    df = df[["code", "name", "report_year", "ann_date", "title", "detail_url", "pdf_url"]]
 
-    for _, r in manifest_df.iterrows():
-        code = str(r["code"]).strip()
-        year = int(r["report_year"])
-        pdf_path = pdf_dir / safe_pdf_name(code, year)
-
-        base = {
-            "code": code,
-            "name": str(r.get("name", "")).strip(),
-            "report_year": year,
-            "ann_date": str(r.get("ann_date", "")).strip(),
-            "title": str(r.get("title", "")).strip(),
-            "detail_url": str(r.get("detail_url", "")).strip(),
-            "pdf_url": str(r.get("pdf_url", "")).strip(),
-            "pdf_path": str(pdf_path),
-        }
-
-        if is_pdf_file(pdf_path):
-            base["file_size"] = int(pdf_path.stat().st_size)
-            rows_ok.append(base)
-        else:
-            dr = error_map.get((code, year))
-            base["status_code"] = dr.status_code if dr else ""
-            base["last_url"] = dr.last_url if dr else ""
-            base["error_type"] = dr.error_type if dr else ""
-            base["error_message"] = dr.error_message if dr else ""
-            rows_bad.append(base)
-
-    return pd.DataFrame(rows_ok), pd.DataFrame(rows_bad)
+    # 一次 scandir 拿到目录下所有有效 PDF，代替逐行 stat + 读文件头
+    good = scan_pdf_dir(pdf_dir)
+    pdf_name = df["code"] + "_" + df["report_year"].astype(str) + ".pdf"
+    df["pdf_path"] = [str(pdf_dir / n) for n in pdf_name]
+    file_size = pdf_name.map(good).fillna(0).astype(int)
+    ok = pdf_name.isin(good.keys())
+
+    ok_df = df.loc[ok].copy()
+    ok_df["file_size"] = file_size[ok]
+
+    bad_df = df.loc[~ok].copy()
+    drs = [error_map.get(k) for k in zip(bad_df["code"], bad_df["report_year"])]
+    bad_df["status_code"] = [dr.status_code if dr else "" for dr in drs]
+    bad_df["last_url"] = [dr.last_url if dr else "" for dr in drs]
+    bad_df["error_type"] = [dr.error_type if dr else "" for dr in drs]
+    bad_df["error_message"] = [dr.error_message if dr else "" for dr in drs]
+
+    return ok_df.reset_index(drop=True), bad_df.reset_index(drop=True)
 
 
 def main(argv: Optional[list[str]] = None) -> int:
@@ -324,22 +400,24 @@ def main(argv: Optional[list[str]] = None) -> int:
     if args.limit:
         manifest_df = manifest_df.head(args.limit)
 
+    good = scan_pdf_dir(pdf_dir)
     need_rows = []
     for _, r in manifest_df.iterrows():
         code = str(r["code"]).strip()
         year = int(r["report_year"])
         if only_failed_keys is not None and (code, year) not in only_failed_keys:
             continue
-        pdf_path = pdf_dir / safe_pdf_name(code, year)
-        if not is_pdf_file(pdf_path):
+        if safe_pdf_name(code, year) not in good:
             need_rows.append(r.to_dict())
 
     print(f"[Step3] 清单总数: {len(manifest_df)}，本次需尝试下载: {len(need_rows)}，workers={args.workers}")
     error_map: dict[tuple[str, int], DownloadResult] = {}
 
     if need_rows:
-        with cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
-            futures = [ex.submit(download_one, row, pdf_dir) for row in need_rows]
+        limiter = TokenBucket(config.DOWNLOAD_RATE_PER_SEC, args.workers)
+        session = make_session(args.workers)
+        with session, cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
+            futures = [ex.submit(download_one, row, pdf_dir, session, limiter) for row in need_rows]
             for fut in tqdm(cf.as_completed(futures), total=len(futures), desc="Step3 下载PDF"):
                 res = fut.result()
                 error_map[(res.code, res.report_year)] = res
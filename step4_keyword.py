@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 """
-Step 4: 抽取 + 词频（多线程）
+Step 4: 抽取 + 词频（多进程）
 输入：output/pdf_download_success.csv
 输出：output/keyword_counts.csv
 
@@ -16,19 +16,24 @@ Step 4: 抽取 + 词频（多线程）
 说明：
 - 这一步完全离线（不依赖 akshare / cninfo 网络）
 - 非常适合你改关键词后反复重算
+- 去空白后的文本会缓存到 output/text_cache/（按 PDF 大小+修改时间失效），
+  改关键词重算时不再重新解析 PDF；目录/开关见 config.TEXT_CACHE_DIR_OVERRIDE / TEXT_CACHE_ENABLED
 """
 
 from __future__ import annotations
 
 import argparse
 import concurrent.futures as cf
-import csv
+import io
+import os
 import re
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple, Set
 
+import ahocorasick  # pyahocorasick
 import pandas as pd
+import zstandard
 from tqdm import tqdm
 
 import fitz  # PyMuPDF
@@ -36,8 +41,20 @@ import fitz  # PyMuPDF
 import config
 
 
+# ASCII 文本里所有会被 \s 匹配的字符
+_ASCII_WS_TABLE = dict.fromkeys(map(ord, " \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f"), None)
+
+
 def clean_spaces(s: str) -> str:
-    return re.sub(r"\s+", "", s or "")
+    r"""
+    去掉所有空白（与 re.sub(r"\s+", "", s) 结果一致）
+    - 纯 ASCII：str.translate 最快
+    - 含中文：str.split() 按 Unicode 空白切分再拼接，比 translate/正则都快
+    """
+    s = s or ""
+    if s.isascii():
+        return s.translate(_ASCII_WS_TABLE)
+    return "".join(s.split())
 
 
 @dataclass(frozen=True)
@@ -60,29 +77,141 @@ def prepare_keywords(groups: Dict[str, List[str]]) -> List[KeywordItem]:
     return out
 
 
+def _build_automaton(pairs: List[Tuple[str, str]]) -> Optional[ahocorasick.Automaton]:
+    """
+    pairs: [(匹配串, 原始关键词)]，同一匹配串可能对应多个原始关键词
+    """
+    by_key: Dict[str, List[str]] = {}
+    for key, raw in pairs:
+        if key:
+            by_key.setdefault(key, []).append(raw)
+    if not by_key:
+        return None
+    A = ahocorasick.Automaton()
+    for key, raws in by_key.items():
+        A.add_word(key, (len(key), tuple(raws)))
+    A.make_automaton()
+    return A
+
+
+def build_automata(kw_items: List[KeywordItem]) -> Tuple[Optional[ahocorasick.Automaton], Optional[ahocorasick.Automaton]]:
+    """
+    返回 (含英文关键词的自动机：在大写文本上匹配, 纯中文关键词的自动机：在原文本上匹配)
+    """
+    a_ascii = _build_automaton([(k.norm.upper(), k.raw) for k in kw_items if k.has_ascii])
+    a_cn = _build_automaton([(k.norm, k.raw) for k in kw_items if not k.has_ascii])
+    return a_ascii, a_cn
+
+
 KW_ITEMS = prepare_keywords(config.KEYWORD_GROUPS)
+KW_AUTOMATA = None  # 每个进程首次使用时构建（见 _init_worker）
+
+
+def get_automata():
+    global KW_AUTOMATA
+    if KW_AUTOMATA is None:
+        KW_AUTOMATA = build_automata(KW_ITEMS)
+    return KW_AUTOMATA
+
+
+def _init_worker() -> None:
+    # 进程池初始化：每个 worker 只构建一次自动机
+    get_automata()
+
+
+# 只保留裁剪到页面范围；关闭连字/空白保留等后处理（后续会去掉所有空白，不影响词频）
+TEXT_FLAGS = fitz.TEXT_MEDIABOX_CLIP
 
 
 def extract_text_from_pdf(pdf_path: Path) -> str:
-    doc = fitz.open(pdf_path)
-    chunks = []
+    """
+    先抽样首/中/尾 3 页：文字几乎为空则判为扫描版，只返回抽样文本（长度必然 < TEXT_MIN_LEN），
+    不再抽取全部页面
+    """
+    buf = io.StringIO()
+    with fitz.open(pdf_path) as doc:
+        n = len(doc)
+        probe = sorted({0, n // 2, n - 1}) if n else []
+        sampled = {i: doc[i].get_text("text", sort=False, flags=TEXT_FLAGS) for i in probe}
+        sample = "".join(sampled.values())
+        threshold = min(len(probe) * config.SCAN_PAGE_MIN_LEN, config.TEXT_MIN_LEN)
+        if len(clean_spaces(sample)) < threshold:
+            return sample
+        for i, page in enumerate(doc):
+            text = sampled.get(i)
+            buf.write(text if text is not None else page.get_text("text", sort=False, flags=TEXT_FLAGS))
+    return buf.getvalue()
+
+
+def get_text_cache_dir() -> Path:
+    if config.TEXT_CACHE_DIR_OVERRIDE is not None:
+        return Path(config.TEXT_CACHE_DIR_OVERRIDE)
+    return config.OUTPUT_DIR / "text_cache"
+
+
+TEXT_CACHE_DIR = get_text_cache_dir()
+# 抽取方式变了（代码逻辑 / TEXT_FLAGS / 扫描版抽样阈值）就要让旧缓存失效；改抽取逻辑时递增
+TEXT_EXTRACTOR_VERSION = 1
+
+
+def _cache_paths(code: str, year: int) -> Tuple[Path, Path]:
+    base = TEXT_CACHE_DIR / f"{code}_{year}"
+    return base.with_suffix(".txt.zst"), base.with_suffix(".stamp")
+
+
+def _pdf_stamp(pdf_path: Path) -> str:
+    st = os.stat(pdf_path)
+    return (f"v{TEXT_EXTRACTOR_VERSION} flags={TEXT_FLAGS} "
+            f"scan={config.SCAN_PAGE_MIN_LEN}/{config.TEXT_MIN_LEN} "
+            f"{st.st_size} {st.st_mtime_ns}")
+
+
+def load_cached_text(code: str, year: int, stamp: str) -> Optional[str]:
+    cache_path, stamp_path = _cache_paths(code, year)
+    try:
+        if stamp_path.read_text(encoding="ascii").strip() != stamp:
+            return None
+        return zstandard.ZstdDecompressor().decompress(cache_path.read_bytes()).decode("utf-8")
+    except Exception:
+        return None
+
+
+def save_cached_text(code: str, year: int, stamp: str, t_norm: str) -> None:
+    cache_path, stamp_path = _cache_paths(code, year)
     try:
-        for page in doc:
-            chunks.append(page.get_text("text"))
-    finally:
-        doc.close()
-    return "\n".join(chunks)
-
-
-def count_keywords(text: str, kw_items: List[KeywordItem]) -> Dict[str, int]:
-    t_norm = clean_spaces(text)
-    t_upper = t_norm.upper()
-    counts: Dict[str, int] = {}
-    for item in kw_items:
-        if item.has_ascii:
-            counts[item.raw] = t_upper.count(item.norm.upper())
-        else:
-            counts[item.raw] = t_norm.count(item.norm)
+        TEXT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        suffix = f".{os.getpid()}.tmp"
+        tmp = cache_path.with_name(cache_path.name + suffix)
+        tmp.write_bytes(zstandard.ZstdCompressor(level=3).compress(t_norm.encode("utf-8")))
+        os.replace(tmp, cache_path)
+        tmp = stamp_path.with_name(stamp_path.name + suffix)
+        tmp.write_text(stamp, encoding="ascii")
+        os.replace(tmp, stamp_path)
+    except Exception:
+        pass  # 缓存写失败不影响结果
+
+
+def _scan(A: Optional[ahocorasick.Automaton], text: str, counts: Dict[str, int]) -> None:
+    if A is None:
+        return
+    # 与 str.count 一致：同一关键词的匹配不重叠计数
+    last_end: Dict[str, int] = {}
+    for end, (n, raws) in A.iter(text):
+        start = end - n + 1
+        for raw in raws:
+            if start > last_end.get(raw, -1):
+                counts[raw] += 1
+                last_end[raw] = end
+
+
+def count_keywords(t_norm: str, kw_items: List[KeywordItem], automata=None) -> Dict[str, int]:
+    """
+    t_norm: 已经 clean_spaces 过的文本（调用方只做一次去空白）
+    """
+    a_ascii, a_cn = automata if automata is not None else get_automata()
+    counts: Dict[str, int] = dict.fromkeys([item.raw for item in kw_items], 0)
+    _scan(a_ascii, t_norm.upper(), counts)
+    _scan(a_cn, t_norm, counts)
     return counts
 
 
@@ -91,12 +220,11 @@ def load_done_set(out_csv: Path) -> Set[Tuple[str, int]]:
     if not out_csv.exists():
         return done
     try:
-        df = pd.read_csv(out_csv, dtype={"code": str}, keep_default_na=False)
-        for _, r in df.iterrows():
-            code = str(r.get("code", "")).strip()
-            year = int(str(r.get("report_year", "0")).strip() or "0")
-            if code and year:
-                done.add((code, year))
+        df = pd.read_csv(out_csv, dtype={"code": str}, usecols=["code", "report_year"], keep_default_na=False)
+        codes = df["code"].str.strip()
+        years = pd.to_numeric(df["report_year"], errors="coerce").fillna(0).astype(int)
+        mask = codes.str.len().gt(0) & years.ne(0)
+        done = set(zip(codes[mask], years[mask]))
     except Exception:
         pass
     return done
@@ -112,18 +240,21 @@ def process_one(row: dict) -> dict:
     pdf_url = str(row.get("pdf_url", "")).strip()
     pdf_path = Path(str(row.get("pdf_path", "")).strip())
 
-    if not pdf_path.exists():
-        raise FileNotFoundError(f"PDF 不存在: {pdf_path}")
-
-    text = extract_text_from_pdf(pdf_path)
+    if config.TEXT_CACHE_ENABLED:
+        stamp = _pdf_stamp(pdf_path)
+        t_norm = load_cached_text(code, year, stamp)
+        if t_norm is None:
+            t_norm = clean_spaces(extract_text_from_pdf(pdf_path))
+            save_cached_text(code, year, stamp, t_norm)
+    else:
+        t_norm = clean_spaces(extract_text_from_pdf(pdf_path))
+    text_len = len(t_norm)
 
-    if len(clean_spaces(text)) < config.TEXT_MIN_LEN:
+    if text_len < config.TEXT_MIN_LEN:
         counts = {k.raw: 0 for k in KW_ITEMS}
-        text_len = len(clean_spaces(text))
         scan_flag = 1
     else:
-        counts = count_keywords(text, KW_ITEMS)
-        text_len = len(clean_spaces(text))
+        counts = count_keywords(t_norm, KW_ITEMS)
         scan_flag = 0
 
     out = {
@@ -142,6 +273,32 @@ def process_one(row: dict) -> dict:
     return out
 
 
+def existing_mask(pdf_paths: pd.Series) -> pd.Series:
+    """
+    每个目录只 scandir 一次，批量判断 pdf_path 是否存在（代替逐个 exists()）
+    """
+    paths = [Path(str(p).strip()) for p in pdf_paths]
+    listing: Dict[Path, Set[str]] = {}
+    for parent in {p.parent for p in paths}:
+        try:
+            with os.scandir(parent) as it:
+                listing[parent] = {e.name for e in it if e.is_file()}
+        except OSError:
+            listing[parent] = set()
+    return pd.Series([p.name in listing[p.parent] for p in paths], index=pdf_paths.index, dtype=bool)
+
+
+WRITE_BATCH = 500  # 每攒 N 行结果批量写一次 CSV
+
+
+def _process_safe(row: dict) -> Tuple[Optional[dict], str]:
+    # 进程池里单个任务失败不应中断整个 map
+    try:
+        return process_one(row), ""
+    except Exception as e:
+        return None, str(e)
+
+
 def main(argv: Optional[list[str]] = None) -> int:
     parser = argparse.ArgumentParser()
     parser.add_argument("--workers", type=int, default=config.EXTRACT_WORKERS, help="抽取+词频并发数")
@@ -163,36 +320,53 @@ def main(argv: Optional[list[str]] = None) -> int:
     df = pd.read_csv(in_path, dtype={"code": str}, keep_default_na=False)
     if args.limit:
         df = df.head(args.limit)
+    total = len(df)
+    df["code"] = df["code"].astype(str).str.strip()
+    df["report_year"] = pd.to_numeric(df["report_year"], errors="coerce").fillna(0).astype(int)
+    df = df[(df["code"] != "") & (df["report_year"] != 0)]
 
     done = load_done_set(out_csv)
     kw_cols = [k.raw for k in KW_ITEMS]
     fieldnames = ["code", "name", "report_year", "ann_date", "title", "detail_url", "pdf_url", "pdf_path", "text_len", "scan_like"] + kw_cols
 
     write_header = not out_csv.exists()
-    total = len(df)
+
+    # 先跳过已完成的，再只对待处理的行检查 PDF 是否存在
+    todo = pd.Series([k not in done for k in zip(df["code"], df["report_year"])], index=df.index, dtype=bool)
+    df = df.loc[todo]
+    exists = existing_mask(df["pdf_path"])
+    for p in df.loc[~exists, "pdf_path"]:
+        print(f"[Step4] 失败：PDF 不存在: {p}")
+    df = df.loc[exists]
 
     with open(out_csv, "a", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
         if write_header:
-            writer.writeheader()
-
-        tasks = []
-        with cf.ThreadPoolExecutor(max_workers=args.workers) as ex:
-            for _, r in df.iterrows():
-                code = str(r.get("code", "")).strip()
-                year = int(str(r.get("report_year", "0")).strip() or "0")
-                if not code or not year:
-                    continue
-                if (code, year) in done:
-                    continue
-                tasks.append(ex.submit(process_one, r.to_dict()))
-
-            for fut in tqdm(cf.as_completed(tasks), total=len(tasks), desc="Step4 抽取+词频"):
-                try:
-                    row = fut.result()
-                    writer.writerow(row)
-                except Exception as e:
-                    print(f"[Step4] 失败：{e}")
+            pd.DataFrame(columns=fieldnames).to_csv(f, index=False)
+
+        batch: List[dict] = []
+
+        def flush() -> None:
+            if batch:
+                pd.DataFrame(batch, columns=fieldnames).to_csv(f, header=False, index=False)
+                f.flush()
+                batch.clear()
+
+        tasks = [r._asdict() for r in df.itertuples(index=False)]
+
+        chunksize = max(1, min(8, len(tasks) // (args.workers * 4)))
+        with cf.ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as ex:
+            results = ex.map(_process_safe, tasks, chunksize=chunksize)
+            try:
+                for row, err in tqdm(results, total=len(tasks), desc="Step4 抽取+词频"):
+                    if row is None:
+                        print(f"[Step4] 失败：{err}")
+                        continue
+                    batch.append(row)
+                    if len(batch) >= WRITE_BATCH:
+                        flush()
+            finally:
+                # 进程池崩溃 / Ctrl-C 时也把已完成的结果写出，断点续跑可跳过
+                flush()
 
     print(f"[Step4] 完成：{out_csv}（新增 {len(tasks)} 行，输入 {total} 行）")
     return 0